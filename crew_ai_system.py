@@ -4,25 +4,150 @@ Multi-Agent Stuttgart Building Regulations System using CrewAI
 """
 
 import os
+import re
 import json
-from typing import List, Dict, Any, Optional
+import asyncio
+import functools
+import hashlib
+from concurrent.futures import Executor
+from pathlib import Path
+from typing import List, Dict, Any, Optional, AsyncIterator, Tuple
 from dataclasses import dataclass
 from datetime import datetime
 import logging
 
+import httpx
+import numpy as np
+
 # CrewAI imports
 from crewai import Agent, Task, Crew, Process
+from crewai.tasks.task_output import TaskOutput
+from crewai.utilities.pydantic_schema_parser import PydanticSchemaParser
 from langchain.tools import Tool
 from langchain_openai import ChatOpenAI
-from langchain.schema import Document
+from langchain.schema import Document, HumanMessage, SystemMessage
+from pydantic import Field
 
 # Custom imports (your existing system)
 from precomputed_rag import EnhancedPrecomputedRAGSystem as PrecomputedRAGSystem
+from semantic_cache import ExactMatchStore, SemanticCache, TaskCache
+from schemas import DocResearchResult, HierarchyAnalysis, TechnicalReqs, ComplianceStrategy
 
 # Setup logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Local cache storage (semantic response cache, etc.)
+CACHE_DIR = Path(os.getenv("CACHE_DIR", Path(__file__).parent / ".cache"))
+
+# Task description templates, rendered per query with str.format
+DOCUMENT_RESEARCH_TEMPLATE = """Research all relevant building regulations for: {query.query}
+            Project details:
+            - Type: {query.project_type}
+            - Location: {query.location}
+            - District: {query.district}
+            
+            Use the document search system to find regulations from:
+            1. Federal level (BauGB, DIN standards)
+            2. State level (LBO Baden-Württemberg)
+            3. Local level (Stuttgart municipal regulations)
+            4. District-specific requirements for {query.district}
+            
+            Search through the 8,826 document database and provide detailed citations with:
+            - Document names and file paths
+            - Page numbers and sections
+            - Content excerpts
+            - Legal reference numbers"""
+
+LEGAL_HIERARCHY_TEMPLATE = """Analyze the regulatory hierarchy for the regulations found in the previous task.
+            
+            Use legal hierarchy analysis to determine:
+            1. Which regulations take precedence (federal > state > local)
+            2. Any conflicts between different regulatory levels
+            3. How local Stuttgart regulations interact with state LBO BW
+            4. Special provisions for {query.district} district
+            5. Override conditions where local rules supersede state rules
+            
+            Provide clear guidance on regulatory priority and conflict resolution."""
+
+TECHNICAL_ANALYSIS_TEMPLATE = """Analyze technical requirements for: {query.query}
+            
+            Focus on technical standards including:
+            1. DIN standards (accessibility DIN 18040, sound insulation DIN 4109, etc.)
+            2. Fire safety requirements for {query.project_type}
+            3. Energy efficiency standards (EnEV/GEG)
+            4. Structural and safety requirements
+            5. Building physics requirements
+            
+            Translate technical standards into practical implementation requirements with specific compliance criteria."""
+
+COMPLIANCE_STRATEGY_TEMPLATE = """Develop comprehensive compliance strategy for: {query.query}
+            
+            Use compliance cost analysis to assess:
+            1. Cost implications of different compliance approaches
+            2. Timeline requirements for permits and approvals
+            3. Risk assessment for non-compliance scenarios
+            4. Alternative compliance methods where permitted
+            5. Cost multipliers for accessibility, fire safety, energy efficiency
+            6. Estimated additional timeline (weeks) for each requirement
+            
+            Provide detailed cost-benefit analysis and strategic recommendations."""
+
+SYNTHESIS_TEMPLATE = """Synthesize all previous analyses into a professional consultation report for: {query.query}
+            
+            Integrate findings from:
+            - Document research results
+            - Legal hierarchy analysis  
+            - Technical requirements assessment
+            - Compliance strategy recommendations
+            
+            Create a comprehensive response including:
+            1. Executive Summary with key requirements
+            2. Detailed regulatory analysis with precise citations
+            3. Step-by-step compliance roadmap
+            4. Cost and timeline estimates with breakdowns
+            5. Risk factors and mitigation strategies
+            6. Required forms and documents list
+            7. Next steps and recommended actions
+            8. Professional recommendations for implementation
+            
+            Format as a professional consultation report suitable for architects, developers, or city officials."""
+
+# Query text for several questions about the same project answered by one crew run
+MERGED_QUERY_TEMPLATE = """the following {count} questions about the same project. Answer each one separately.
+{questions}
+            
+            Structure the final report as one section per question, each section starting
+            on its own line with "Answer N:" where N is the question number. Write nothing
+            outside these sections: every section must stand on its own, repeating any
+            summary, cost or timeline figures that apply to it."""
+
+# Section headings of a merged report, tolerating markdown emphasis and heading marks
+ANSWER_HEADING = re.compile(r"^[#*_\s]*Answer\s+(\d+)\s*[*_]*\s*[:.)-]?[*_]*", re.IGNORECASE | re.MULTILINE)
+
+def split_numbered_answers(report: str, count: int) -> Optional[List[str]]:
+    """Split a merged report into its "Answer N:" sections, or None if any are missing"""
+    parts = ANSWER_HEADING.split(report)
+    sections: Dict[int, str] = {}
+    for number, body in zip(parts[1::2], parts[2::2]):
+        sections.setdefault(int(number), body.strip())
+    
+    if any(not sections.get(number) for number in range(1, count + 1)):
+        return None
+    return [sections[number] for number in range(1, count + 1)]
+
+def structured_output(model, summary: str) -> str:
+    """Expected output asking for compact JSON matching a pydantic model"""
+    return f"""{summary}, as a JSON object with these fields:
+{PydanticSchemaParser(model=model).get_schema()}
+Return only the JSON object. Keep every text field brief."""
+
+def create_http_client(asynchronous: bool = False):
+    """HTTP/2 keep-alive connection pool for the OpenAI API"""
+    limits = httpx.Limits(max_connections=100, max_keepalive_connections=50)
+    client_class = httpx.AsyncClient if asynchronous else httpx.Client
+    return client_class(http2=True, timeout=60.0, limits=limits)
+
 @dataclass
 class RegulationQuery:
     """Structure for regulation queries"""
@@ -31,55 +156,252 @@ class RegulationQuery:
     location: str = "Stuttgart"
     district: str = "general"
     urgency: str = "normal"
+
+    @property
+    def cache_text(self) -> str:
+        """Text embedded for semantic cache lookups"""
+        return f"{self.query}|{self.project_type}|{self.district}|{self.location}"
+
+    @property
+    def cache_scope(self) -> str:
+        """Cache partition - reports are only reused within the same project context"""
+        return f"{self.project_type}|{self.district}|{self.location}"
+    
+class MemoizedTask(Task):
+    """Task that reuses a previous output for the same (or a paraphrased) rendering"""
+    
+    output_cache: Optional[Any] = Field(
+        description="TaskCache used to memoize this task's output.",
+        default=None,
+        exclude=True,
+    )
+    context_summarizer: Optional[Any] = Field(
+        description="Cheap LLM used to compress long upstream outputs before they enter this task's context.",
+        default=None,
+        exclude=True,
+    )
+    context_token_budget: int = Field(
+        description="Approximate token budget per upstream output when a context summarizer is set.",
+        default=500,
+    )
+    cache_query: str = Field(
+        description="Query text compared semantically on task cache lookups; exact matches only if empty.",
+        default="",
+    )
+    cache_scope: str = Field(
+        description="Project context and pre-retrieved documents a cached output is only reused within.",
+        default="",
+    )
+    cache_vector: Optional[Any] = Field(
+        description="Embedding of cache_query, shared by the crew's tasks so the query is embedded once.",
+        default=None,
+        exclude=True,
+    )
+    
+    def context_text(self) -> str:
+        """Aggregate upstream outputs, summarizing any that exceed the token budget"""
+        outputs = [task.output.raw for task in self.context or [] if task.output is not None]
+        
+        # ~4 characters per token
+        too_long = [i for i, raw in enumerate(outputs) if len(raw) > self.context_token_budget * 4]
+        if self.context_summarizer is not None and too_long:
+            summaries = self.context_summarizer.batch([
+                f"Summarize the following analysis in at most {self.context_token_budget} tokens. "
+                f"Keep every regulation citation, figure, cost and timeline.\n\n{outputs[i]}"
+                for i in too_long
+            ])
+            for i, summary in zip(too_long, summaries):
+                outputs[i] = summary.content
+        
+        # Same divider CrewAI uses when aggregating task outputs
+        return "\n\n----------\n\n".join(outputs)
+    
+    def _execute_core(self, agent, context, tools) -> TaskOutput:
+        """Check the task cache before dispatching to the agent's LLM.
+        
+        Overridden at the core (rather than execute_sync) so tasks run with
+        async_execution are memoized as well.
+        """
+        agent = agent or self.agent
+        if self.output_cache is None or agent is None:
+            return self._compact(super()._execute_core(agent, self._llm_context(context), tools))
+        
+        # Exact entries are keyed on the full prompt; paraphrase matches compare only the
+        # query, within the same project context, documents and expected output format.
+        # Both are keyed on the raw upstream outputs, so summarizing happens only on a miss.
+        prompt = self.prompt()
+        scope = f"{self.cache_scope}|{self.expected_output}"
+        cached = self.output_cache.lookup(
+            agent.role, prompt, context, query_text=self.cache_query, scope=scope, query_vector=self.cache_vector
+        )
+        if cached is None:
+            task_output = self._compact(super()._execute_core(agent, self._llm_context(context), tools))
+            # Free text that failed structured conversion would cost a converter LLM call on every hit
+            if self.output_pydantic is None or task_output.pydantic is not None:
+                self.output_cache.store(
+                    agent.role, prompt, context, task_output.raw,
+                    query_text=self.cache_query, scope=scope, query_vector=self.cache_vector
+                )
+            return task_output
+        
+        self.agent = agent
+        self.prompt_context = context
+        pydantic_output, json_output = self._export_output(cached)
+        self.output = TaskOutput(
+            description=self.description,
+            raw=cached,
+            pydantic=pydantic_output,
+            json_dict=json_output,
+            agent=agent.role,
+            output_format=self._get_output_format()
+        )
+        
+        if self.callback:
+            self.callback(self.output)
+        
+        return self.output
+    
+    def _llm_context(self, context: Optional[str]) -> Optional[str]:
+        """Context handed to the agent: the aggregated outputs, summarized if a summarizer is set"""
+        if self.context_summarizer is not None and self.context:
+            return self.context_text()
+        return context
     
+    @staticmethod
+    def _compact(task_output: TaskOutput) -> TaskOutput:
+        """Replace the raw answer with its validated JSON so downstream context stays compact"""
+        if task_output.pydantic is not None:
+            task_output.raw = task_output.pydantic.model_dump_json()
+        return task_output
+
+@functools.lru_cache(maxsize=1)
+def _get_rag() -> PrecomputedRAGSystem:
+    """Load the RAG index once per process and share it across crews"""
+    return PrecomputedRAGSystem()
+
 class DocumentSearchTool:
     """Custom tool for searching building regulations"""
     
-    def __init__(self):
-        self.rag_system = PrecomputedRAGSystem()
+    # Per-result block, filled with %-formatting (document no., file, category, page, preview)
+    result_template = """
+Document %d:
+- File: %s
+- Category: %s
+- Page: %s
+- Content Preview: %s...
+                """
+    
+    # Result metadata types that signal a failed search and must not be cached
+    _uncacheable_types = {"system_error", "no_embeddings", "search_error"}
+    
+    def __init__(self, cache_ttl: float = 24 * 60 * 60, cache_max_entries: int = 10000):
+        self.rag_system = _get_rag()
+        
+        # Formatted results persist across restarts, expire after cache_ttl and are culled
+        # oldest-first past cache_max_entries; the embeddings file mtime is part of every
+        # key so a rebuilt corpus invalidates old entries
+        self._cache = ExactMatchStore(CACHE_DIR / "rag" / "search_results.sqlite3", max_entries=cache_max_entries)
+        self._cache_ttl = cache_ttl
+        embeddings_path = self.rag_system.embeddings_dir / "embeddings.npy"
+        self._corpus_version = os.path.getmtime(embeddings_path) if embeddings_path.exists() else 0.0
+    
+    def _cache_key(self, query: str, top_k: int) -> str:
+        key = f"{query}|{top_k}|{self._corpus_version}"
+        return hashlib.blake2b(key.encode("utf-8"), digest_size=16).hexdigest()
+    
+    def _cache_results(self, key: str, query: str, results: list) -> str:
+        formatted = self._format_results(query, results)
+        if not any(result.metadata.get("type") in self._uncacheable_types for result in results):
+            self._cache.set(key, formatted, expire=self._cache_ttl)
+        return formatted
     
     def search_documents(self, query: str, top_k: int = 5) -> str:
         """Search documents and return formatted results"""
         try:
+            key = self._cache_key(query, top_k)
+            cached = self._cache.get(key)
+            if cached is not None:
+                return cached
+            
             results = self.rag_system.search(query, top_k=top_k)
+            return self._cache_results(key, query, results)
             
-            if not results:
-                return f"No relevant documents found for query: {query}"
-            
-            formatted_results = []
-            for i, result in enumerate(results, 1):
-                metadata = result.get('metadata', {})
-                content = result.get('content', '')[:500]
-                
-                formatted_result = f"""
-Document {i}:
-- File: {metadata.get('document_name', 'Unknown')}
-- Category: {metadata.get('category', 'Unknown')}
-- Page: {metadata.get('page_number', 'Unknown')}
-- Content Preview: {content}...
-                """
-                formatted_results.append(formatted_result)
+        except Exception as e:
+            return f"Error searching documents: {str(e)}"
+    
+    def search_documents_batch(self, queries: List[str], top_k: int = 5) -> List[str]:
+        """Search documents for many queries at once and return formatted results per query"""
+        try:
+            keys = [self._cache_key(query, top_k) for query in queries]
+            formatted = [self._cache.get(key) for key in keys]
+            
+            # Only the cache misses go through the batched search
+            misses = [i for i, cached in enumerate(formatted) if cached is None]
+            if misses:
+                batch_results = self.rag_system.search_batch([queries[i] for i in misses], top_k=top_k)
+                for i, results in zip(misses, batch_results):
+                    formatted[i] = self._cache_results(keys[i], queries[i], results)
             
-            return "\n".join(formatted_results)
+            return formatted
             
         except Exception as e:
-            return f"Error searching documents: {str(e)}"
+            return [f"Error searching documents: {str(e)}" for _ in queries]
+    
+    @classmethod
+    def _format_results(cls, query: str, results: list) -> str:
+        """Format RAG results for an agent prompt"""
+        if not results:
+            return f"No relevant documents found for query: {query}"
+        
+        return "\n".join(
+            cls.result_template % (
+                i,
+                result.metadata.get('document_name', 'Unknown'),
+                result.metadata.get('category', 'Unknown'),
+                result.metadata.get('page_number', 'Unknown'),
+                result.content[:500]
+            )
+            for i, result in enumerate(results, 1)
+        )
 
 class LegalHierarchyTool:
     """Tool for understanding regulatory hierarchy"""
     
+    hierarchy_rules = {
+        "federal": ["BauGB", "EnEV", "GEG", "DIN", "VDI"],
+        "state": ["LBO", "Baden-Württemberg", "BW"],
+        "local": ["Stuttgart", "Zuffenhausen", "Municipal", "Stadt"]
+    }
+    
+    def __init__(self):
+        # A single case-insensitive alternation over every keyword, compiled once, with one
+        # named group per level: case folding can match text whose lower() is no keyword
+        self._keyword_pattern = re.compile(
+            "|".join(
+                f"(?P<{level}>{'|'.join(map(re.escape, sorted(keywords, key=len, reverse=True)))})"
+                for level, keywords in self.hierarchy_rules.items()
+            ),
+            re.IGNORECASE
+        )
+    
+    def _scan_levels(self, regulations: str) -> frozenset:
+        """Return the hierarchy levels whose keywords occur in the text"""
+        levels_found = set()
+        for match in self._keyword_pattern.finditer(regulations):
+            levels_found.add(match.lastgroup)
+            if len(levels_found) == len(self.hierarchy_rules):
+                break
+        return frozenset(levels_found)
+    
     def analyze_hierarchy(self, regulations: str) -> str:
         """Analyze regulatory hierarchy"""
-        hierarchy_rules = {
-            "federal": ["BauGB", "EnEV", "GEG", "DIN", "VDI"],
-            "state": ["LBO", "Baden-Württemberg", "BW"],
-            "local": ["Stuttgart", "Zuffenhausen", "Municipal", "Stadt"]
-        }
+        levels_found = self._scan_levels(regulations)
         
-        analysis = []
-        for level, keywords in hierarchy_rules.items():
-            if any(keyword.lower() in regulations.lower() for keyword in keywords):
-                analysis.append(f"{level.upper()} level regulations identified")
+        analysis = [
+            f"{level.upper()} level regulations identified"
+            for level in self.hierarchy_rules
+            if level in levels_found
+        ]
         
         if len(analysis) > 1:
             return f"Multiple regulatory levels apply. Hierarchy: {' > '.join(analysis)}. Local regulations may override state where specifically permitted."
@@ -91,25 +413,37 @@ class LegalHierarchyTool:
 class ComplianceCostTool:
     """Tool for estimating compliance costs"""
     
+    cost_factors = {
+        "accessibility": {"cost_multiplier": 1.1, "time_weeks": 2},
+        "fire_safety": {"cost_multiplier": 1.15, "time_weeks": 3},
+        "energy_efficiency": {"cost_multiplier": 1.2, "time_weeks": 4},
+        "parking": {"cost_multiplier": 1.05, "time_weeks": 1},
+        "setback": {"cost_multiplier": 1.02, "time_weeks": 1}
+    }
+    
+    def __init__(self):
+        # Single-pass scan for every factor, compiled once
+        self._factor_pattern = re.compile(
+            "|".join(map(re.escape, self.cost_factors)), re.IGNORECASE
+        )
+        
+        # Factor values as aligned arrays so the aggregate is one masked reduce
+        self._factors = list(self.cost_factors)
+        self._mults = np.array([values["cost_multiplier"] for values in self.cost_factors.values()])
+        self._weeks = np.array([values["time_weeks"] for values in self.cost_factors.values()])
+    
+    def _scan_factors(self, requirements: str) -> frozenset:
+        """Return the cost factors mentioned in the text"""
+        return frozenset(match.group(0).lower() for match in self._factor_pattern.finditer(requirements))
+    
     def estimate_costs(self, requirements: str) -> str:
         """Estimate compliance costs"""
-        cost_factors = {
-            "accessibility": {"cost_multiplier": 1.1, "time_weeks": 2},
-            "fire_safety": {"cost_multiplier": 1.15, "time_weeks": 3},
-            "energy_efficiency": {"cost_multiplier": 1.2, "time_weeks": 4},
-            "parking": {"cost_multiplier": 1.05, "time_weeks": 1},
-            "setback": {"cost_multiplier": 1.02, "time_weeks": 1}
-        }
-        
-        applicable_factors = []
-        total_multiplier = 1.0
-        total_time = 0
+        hits = self._scan_factors(requirements)
+        mask = np.fromiter((factor in hits for factor in self._factors), dtype=bool, count=len(self._factors))
         
-        for factor, values in cost_factors.items():
-            if factor in requirements.lower():
-                applicable_factors.append(factor)
-                total_multiplier *= values["cost_multiplier"]
-                total_time += values["time_weeks"]
+        applicable_factors = [factor for factor, applies in zip(self._factors, mask) if applies]
+        total_multiplier = float(self._mults[mask].prod())
+        total_time = int(self._weeks[mask].sum())
         
         if applicable_factors:
             return f"Compliance factors: {', '.join(applicable_factors)}. Estimated cost impact: +{(total_multiplier-1)*100:.1f}%. Timeline: {total_time} weeks additional."
@@ -119,11 +453,35 @@ class ComplianceCostTool:
 class StuttgartBuildingRegulationCrew:
     """Main crew orchestrating the multi-agent system"""
     
-    def __init__(self, openai_api_key: str):
-        self.llm = ChatOpenAI(
-            model="gpt-4",
+    def __init__(
+        self,
+        openai_api_key: str,
+        http_client: Optional[httpx.Client] = None,
+        http_async_client: Optional[httpx.AsyncClient] = None
+    ):
+        # One keep-alive HTTP/2 connection pool shared by all agents' LLM calls,
+        # so TLS handshakes are paid once rather than per request. Clients passed
+        # in stay owned by the caller; only the ones created here are closed here.
+        self._owns_http_client = http_client is None
+        self._owns_http_async_client = http_async_client is None
+        self._http_client = http_client or create_http_client()
+        self._http_async_client = http_async_client or create_http_client(asynchronous=True)
+        
+        # Research, legal, technical and strategy drafts run on a fast model;
+        # only the final synthesis needs a GPT-4-class model
+        self.llm_fast = ChatOpenAI(
+            model="gpt-4o-mini",
+            temperature=0,
+            openai_api_key=openai_api_key,
+            http_client=self._http_client,
+            http_async_client=self._http_async_client
+        )
+        self.llm_strong = ChatOpenAI(
+            model="gpt-4o",
             temperature=0.1,
-            openai_api_key=openai_api_key
+            openai_api_key=openai_api_key,
+            http_client=self._http_client,
+            http_async_client=self._http_async_client
         )
         
         # Initialize tools
@@ -131,6 +489,18 @@ class StuttgartBuildingRegulationCrew:
         self.hierarchy_tool = LegalHierarchyTool()
         self.cost_tool = ComplianceCostTool()
         
+        # Semantic cache of final reports, embedded with the RAG sentence model
+        self.response_cache = SemanticCache(
+            embed_fn=self.document_tool.rag_system.model.encode,
+            cache_dir=CACHE_DIR / "responses"
+        )
+        
+        # Per-task output memoization, so novel queries still reuse shared sub-results
+        self.task_cache = TaskCache(
+            embed_fn=self.document_tool.rag_system.model.encode,
+            cache_dir=CACHE_DIR / "tasks"
+        )
+        
         # Create agents
         self.agents = self._create_agents()
         
@@ -144,7 +514,7 @@ class StuttgartBuildingRegulationCrew:
             documents. You can quickly identify the most relevant regulations for any building 
             project and extract precise citations and requirements.""",
             tools=[],  # Start with no tools to avoid validation error
-            llm=self.llm,
+            llm=self.llm_fast,
             verbose=True
         )
         
@@ -155,7 +525,7 @@ class StuttgartBuildingRegulationCrew:
             the complex interplay between federal (BauGB), state (LBO BW), and municipal regulations. 
             You can determine which regulations take precedence and identify potential conflicts.""",
             tools=[],
-            llm=self.llm,
+            llm=self.llm_fast,
             verbose=True
         )
         
@@ -166,7 +536,7 @@ class StuttgartBuildingRegulationCrew:
             requirements (DIN 18040), fire safety regulations, and energy efficiency standards. 
             You translate technical requirements into practical implementation guidance.""",
             tools=[],
-            llm=self.llm,
+            llm=self.llm_fast,
             verbose=True
         )
         
@@ -177,7 +547,7 @@ class StuttgartBuildingRegulationCrew:
             and architects navigate compliance requirements efficiently. You understand the practical 
             and financial implications of different regulatory approaches.""",
             tools=[],
-            llm=self.llm,
+            llm=self.llm_fast,
             verbose=True
         )
         
@@ -188,7 +558,7 @@ class StuttgartBuildingRegulationCrew:
             regulatory analysis into clear, professional recommendations. You provide decision-makers 
             with the information they need to move forward confidently.""",
             tools=[],
-            llm=self.llm,
+            llm=self.llm_strong,
             verbose=True
         )
         
@@ -200,99 +570,89 @@ class StuttgartBuildingRegulationCrew:
             "synthesis_manager": synthesis_manager
         }
     
-    def create_tasks(self, query: RegulationQuery) -> List[Task]:
-        """Create tasks for the crew based on the query"""
+    def create_tasks(
+        self,
+        query: RegulationQuery,
+        agents: Optional[Dict[str, Agent]] = None,
+        documents: Optional[str] = None,
+        query_vector: Optional[np.ndarray] = None,
+        semantic_cache: bool = True
+    ) -> List[Task]:
+        """Create tasks for the crew based on the query.
         
-        document_research_task = Task(
-            description=f"""Research all relevant building regulations for: {query.query}
-            Project details:
-            - Type: {query.project_type}
-            - Location: {query.location}
-            - District: {query.district}
-            
-            Use the document search system to find regulations from:
-            1. Federal level (BauGB, DIN standards)
-            2. State level (LBO Baden-Württemberg)
-            3. Local level (Stuttgart municipal regulations)
-            4. District-specific requirements for {query.district}
+        query_vector is the embedding of query.cache_text (as returned by
+        cached_analysis); it is computed here if None. Every task's semantic
+        cache lookup and store reuses it. With semantic_cache=False the tasks
+        only reuse outputs of exactly the same rendering.
+        """
+        agents = agents or self.agents
+        cache_query = query.cache_text if semantic_cache else ""
+        if semantic_cache and query_vector is None:
+            query_vector = self.task_cache.semantic.embed(query.cache_text)
+        
+        research_description = DOCUMENT_RESEARCH_TEMPLATE.format(query=query)
+        if documents:
+            research_description += f"""
             
-            Search through the 8,826 document database and provide detailed citations with:
-            - Document names and file paths
-            - Page numbers and sections
-            - Content excerpts
-            - Legal reference numbers""",
-            expected_output="Comprehensive list of relevant regulations with precise citations and content excerpts",
-            agent=self.agents["document_specialist"]
+            Pre-retrieved documents from the database:
+            {documents}"""
+        
+        # Cached task outputs are only reused for the same project context and documents
+        cache_scope = f"{query.cache_scope}|{documents or ''}"
+        
+        document_research_task = MemoizedTask(
+            description=research_description,
+            expected_output=structured_output(DocResearchResult, "Comprehensive list of relevant regulations with precise citations and content excerpts"),
+            output_pydantic=DocResearchResult,
+            agent=agents["document_specialist"],
+            output_cache=self.task_cache,
+            cache_query=cache_query,
+            cache_scope=cache_scope,
+            cache_vector=query_vector
         )
         
-        legal_hierarchy_task = Task(
-            description=f"""Analyze the regulatory hierarchy for the regulations found in the previous task.
-            
-            Use legal hierarchy analysis to determine:
-            1. Which regulations take precedence (federal > state > local)
-            2. Any conflicts between different regulatory levels
-            3. How local Stuttgart regulations interact with state LBO BW
-            4. Special provisions for {query.district} district
-            5. Override conditions where local rules supersede state rules
-            
-            Provide clear guidance on regulatory priority and conflict resolution.""",
-            expected_output="Legal hierarchy analysis with precedence rules and conflict resolution guidance",
-            agent=self.agents["legal_analyst"]
+        legal_hierarchy_task = MemoizedTask(
+            description=LEGAL_HIERARCHY_TEMPLATE.format(query=query),
+            expected_output=structured_output(HierarchyAnalysis, "Legal hierarchy analysis with precedence rules and conflict resolution guidance"),
+            output_pydantic=HierarchyAnalysis,
+            agent=agents["legal_analyst"],
+            output_cache=self.task_cache,
+            cache_query=cache_query,
+            cache_scope=cache_scope,
+            cache_vector=query_vector
         )
         
-        technical_analysis_task = Task(
-            description=f"""Analyze technical requirements for: {query.query}
-            
-            Focus on technical standards including:
-            1. DIN standards (accessibility DIN 18040, sound insulation DIN 4109, etc.)
-            2. Fire safety requirements for {query.project_type}
-            3. Energy efficiency standards (EnEV/GEG)
-            4. Structural and safety requirements
-            5. Building physics requirements
-            
-            Translate technical standards into practical implementation requirements with specific compliance criteria.""",
-            expected_output="Technical requirements summary with implementation guidance and compliance criteria",
-            agent=self.agents["technical_expert"]
+        technical_analysis_task = MemoizedTask(
+            description=TECHNICAL_ANALYSIS_TEMPLATE.format(query=query),
+            expected_output=structured_output(TechnicalReqs, "Technical requirements summary with implementation guidance and compliance criteria"),
+            output_pydantic=TechnicalReqs,
+            agent=agents["technical_expert"],
+            output_cache=self.task_cache,
+            cache_query=cache_query,
+            cache_scope=cache_scope,
+            cache_vector=query_vector
         )
         
-        compliance_strategy_task = Task(
-            description=f"""Develop comprehensive compliance strategy for: {query.query}
-            
-            Use compliance cost analysis to assess:
-            1. Cost implications of different compliance approaches
-            2. Timeline requirements for permits and approvals
-            3. Risk assessment for non-compliance scenarios
-            4. Alternative compliance methods where permitted
-            5. Cost multipliers for accessibility, fire safety, energy efficiency
-            6. Estimated additional timeline (weeks) for each requirement
-            
-            Provide detailed cost-benefit analysis and strategic recommendations.""",
-            expected_output="Compliance strategy with cost analysis, timeline, and risk assessment",
-            agent=self.agents["compliance_strategist"]
+        compliance_strategy_task = MemoizedTask(
+            description=COMPLIANCE_STRATEGY_TEMPLATE.format(query=query),
+            expected_output=structured_output(ComplianceStrategy, "Compliance strategy with cost analysis, timeline, and risk assessment"),
+            output_pydantic=ComplianceStrategy,
+            agent=agents["compliance_strategist"],
+            output_cache=self.task_cache,
+            cache_query=cache_query,
+            cache_scope=cache_scope,
+            cache_vector=query_vector
         )
         
-        synthesis_task = Task(
-            description=f"""Synthesize all previous analyses into a professional consultation report for: {query.query}
-            
-            Integrate findings from:
-            - Document research results
-            - Legal hierarchy analysis  
-            - Technical requirements assessment
-            - Compliance strategy recommendations
-            
-            Create a comprehensive response including:
-            1. Executive Summary with key requirements
-            2. Detailed regulatory analysis with precise citations
-            3. Step-by-step compliance roadmap
-            4. Cost and timeline estimates with breakdowns
-            5. Risk factors and mitigation strategies
-            6. Required forms and documents list
-            7. Next steps and recommended actions
-            8. Professional recommendations for implementation
-            
-            Format as a professional consultation report suitable for architects, developers, or city officials.""",
+        synthesis_task = MemoizedTask(
+            description=SYNTHESIS_TEMPLATE.format(query=query),
             expected_output="Professional consultation report with executive summary, detailed analysis, and actionable recommendations",
-            agent=self.agents["synthesis_manager"]
+            agent=agents["synthesis_manager"],
+            output_cache=self.task_cache,
+            cache_query=cache_query,
+            cache_scope=cache_scope,
+            cache_vector=query_vector,
+            context_summarizer=self.llm_fast
         )
         
         # Set task dependencies - this is crucial for information flow
@@ -301,33 +661,276 @@ class StuttgartBuildingRegulationCrew:
         compliance_strategy_task.context = [document_research_task, legal_hierarchy_task, technical_analysis_task]
         synthesis_task.context = [document_research_task, legal_hierarchy_task, technical_analysis_task, compliance_strategy_task]
         
-        return [document_research_task, legal_hierarchy_task, technical_analysis_task, compliance_strategy_task, synthesis_task]
+        return self._schedule_phases([document_research_task, legal_hierarchy_task, technical_analysis_task, compliance_strategy_task, synthesis_task])
+    
+    @staticmethod
+    def _schedule_phases(tasks: List[Task]) -> List[Task]:
+        """Group tasks into phases from their context dependencies.
+        
+        A task's phase is one past the latest phase it depends on, so tasks sharing
+        a phase are independent of each other. Tasks of a multi-task phase are
+        flagged with async_execution: CrewAI starts them concurrently and the next
+        synchronous task waits for all of them, taking one LLM round trip per extra
+        task off the critical path.
+        
+        CrewAI rejects an async task whose context holds an async task of the same
+        unbroken async run, and a crew ending in more than one async task. So when
+        the previous phase left async tasks pending, the first task of a phase runs
+        synchronously as the join point, and the final task is always synchronous.
+        """
+        phase_of: Dict[int, int] = {}
+        phases: List[List[Task]] = []
+        
+        for task in tasks:
+            phase = 1 + max((phase_of[id(dep)] for dep in task.context or [] if id(dep) in phase_of), default=-1)
+            phase_of[id(task)] = phase
+            if phase == len(phases):
+                phases.append([])
+            phases[phase].append(task)
+        
+        pending = False
+        for phase_tasks in phases:
+            for position, task in enumerate(phase_tasks):
+                task.async_execution = len(phase_tasks) > 1 and not (position == 0 and pending)
+            pending = phase_tasks[-1].async_execution
+        
+        ordered = [task for phase_tasks in phases for task in phase_tasks]
+        if ordered:
+            ordered[-1].async_execution = False
+        return ordered
+    
+    def cached_analysis(self, query: RegulationQuery) -> Tuple[Optional[str], np.ndarray]:
+        """Return the report of a semantically equivalent earlier query (None if not cached)
+        and the query embedding, to hand to execute_analysis on a miss"""
+        query_vector = self.response_cache.embed(query.cache_text)
+        return self.response_cache.lookup(query.cache_text, query.cache_scope, vector=query_vector), query_vector
     
-    def execute_analysis(self, query: RegulationQuery) -> str:
-        """Execute the multi-agent analysis"""
+    def execute_analysis(
+        self,
+        query: RegulationQuery,
+        agents: Optional[Dict[str, Agent]] = None,
+        documents: Optional[str] = None,
+        query_vector: Optional[np.ndarray] = None
+    ) -> str:
+        """Execute the multi-agent analysis.
+        
+        Pass query_vector from a cached_analysis miss to skip the second embedding
+        and cache lookup; the report is still stored under it.
+        """
         try:
-            logger.info(f"Starting multi-agent analysis for: {query.query}")
+            logger.info("Starting multi-agent analysis for: %s", query.query)
+            
+            # Answer paraphrased repeat questions from the semantic cache
+            if query_vector is None:
+                cached, query_vector = self.cached_analysis(query)
+                if cached is not None:
+                    logger.info("Returning cached multi-agent analysis")
+                    return cached
             
-            # Create tasks
-            tasks = self.create_tasks(query)
+            # Create tasks. Agents hold per-kickoff state (crew, executor), so a run
+            # without its own agents gets a fresh set rather than the shared one
+            agents = agents or self._create_agents()
+            tasks = self.create_tasks(query, agents, documents, query_vector)
             
             # Create and execute crew
             crew = Crew(
-                agents=list(self.agents.values()),
+                agents=list(agents.values()),
                 tasks=tasks,
                 process=Process.sequential,
                 verbose=True
             )
             
             # Execute the crew
-            result = crew.kickoff()
+            result = str(crew.kickoff())
+            
+            self.response_cache.store(query.cache_text, query.cache_scope, result, vector=query_vector)
             
             logger.info("Multi-agent analysis completed successfully")
             return result
             
         except Exception as e:
-            logger.error(f"Error in multi-agent analysis: {e}")
+            logger.error("Error in multi-agent analysis: %s", e)
             return f"Error occurred during analysis: {str(e)}"
+    
+    async def execute_analysis_async(
+        self,
+        query: RegulationQuery,
+        executor: Optional[Executor] = None,
+        agents: Optional[Dict[str, Agent]] = None,
+        documents: Optional[str] = None,
+        query_vector: Optional[np.ndarray] = None
+    ) -> str:
+        """Execute the multi-agent analysis without blocking the event loop.
+        
+        The crew runs on executor (the loop's default executor if None). Within
+        the run, independent tasks already execute concurrently (see _schedule_phases).
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            executor, functools.partial(self.execute_analysis, query, agents, documents, query_vector)
+        )
+    
+    def execute_merged_analysis(self, queries: List[RegulationQuery]) -> Optional[List[str]]:
+        """Answer several queries sharing a project context with a single crew run.
+        
+        The questions are numbered into one crew prompt and the report is split
+        back by the same numbering. Returns None when the run fails or the report
+        cannot be split, so the caller can fall back to one analysis per query.
+        
+        The sections are not stored in the response cache: each was written
+        alongside the other questions of the run, which may have shaped it.
+        """
+        first = queries[0]
+        merged = RegulationQuery(
+            query=MERGED_QUERY_TEMPLATE.format(
+                count=len(queries),
+                questions="\n".join(f"            {i}. {query.query}" for i, query in enumerate(queries, 1))
+            ),
+            project_type=first.project_type,
+            location=first.location,
+            district=first.district,
+            urgency=first.urgency
+        )
+        
+        try:
+            logger.info("Starting merged multi-agent analysis of %d queries", len(queries))
+            agents = self._create_agents()
+            crew = Crew(
+                agents=list(agents.values()),
+                # Merged queries are mostly template wording, so a paraphrase match could
+                # hand this batch another batch's answers: exact task matches only
+                tasks=self.create_tasks(merged, agents, semantic_cache=False),
+                process=Process.sequential,
+                verbose=True
+            )
+            answers = split_numbered_answers(str(crew.kickoff()), len(queries))
+        except Exception as e:
+            logger.error("Error in merged multi-agent analysis: %s", e)
+            return None
+        
+        if answers is None:
+            logger.warning("Merged report of %d queries could not be split by question", len(queries))
+            return None
+        
+        logger.info("Merged multi-agent analysis completed successfully")
+        return answers
+    
+    async def stream_analysis(self, query: RegulationQuery, executor: Optional[Executor] = None) -> AsyncIterator[Tuple[str, str]]:
+        """Stream the multi-agent analysis as (agent role, text) pairs.
+        
+        Upstream task outputs are yielded as each task completes, then the
+        synthesis report is streamed token by token. The upstream crew and the
+        context summarization run on executor (the loop's default executor if
+        None), so streams share the bound of the pool with all other crew runs.
+        """
+        loop = asyncio.get_running_loop()
+        synthesis_agent = self.agents["synthesis_manager"]
+        
+        cached, query_vector = await asyncio.to_thread(self.cached_analysis, query)
+        if cached is not None:
+            logger.info("Returning cached multi-agent analysis")
+            yield synthesis_agent.role, cached
+            return
+        
+        try:
+            logger.info("Starting streaming multi-agent analysis for: %s", query.query)
+            
+            # A fresh agent set, so concurrent streams never share per-kickoff agent state
+            agents = self._create_agents()
+            tasks = self.create_tasks(query, agents, query_vector=query_vector)
+            upstream_tasks, synthesis_task = tasks[:-1], tasks[-1]
+            
+            # Run the upstream phases as a crew, reporting each finished task; None marks the end
+            completed: "asyncio.Queue[Optional[TaskOutput]]" = asyncio.Queue()
+            crew = Crew(
+                agents=list(agents.values()),
+                tasks=upstream_tasks,
+                process=Process.sequential,
+                verbose=True,
+                task_callback=lambda task_output: loop.call_soon_threadsafe(completed.put_nowait, task_output)
+            )
+            
+            def run_upstream():
+                try:
+                    return crew.kickoff()
+                finally:
+                    loop.call_soon_threadsafe(completed.put_nowait, None)
+            
+            kickoff = loop.run_in_executor(executor, run_upstream)
+            try:
+                while True:
+                    task_output = await completed.get()
+                    if task_output is None:
+                        break
+                    yield task_output.agent, task_output.raw
+                await kickoff
+            finally:
+                # If the consumer stops reading (client disconnected), a crew still queued
+                # for the pool never starts; one already running finishes in its worker
+                kickoff.cancel()
+            
+            # Stream the synthesis straight from the LLM
+            messages = await loop.run_in_executor(executor, self._synthesis_messages, synthesis_task)
+            report_chunks = []
+            async for chunk in self.llm_strong.astream(messages):
+                if chunk.content:
+                    report_chunks.append(chunk.content)
+                    yield synthesis_agent.role, chunk.content
+            
+            await asyncio.to_thread(
+                self.response_cache.store, query.cache_text, query.cache_scope, "".join(report_chunks), query_vector
+            )
+            logger.info("Streaming multi-agent analysis completed successfully")
+            
+        except Exception as e:
+            logger.error("Error in streaming multi-agent analysis: %s", e)
+            raise
+    
+    @staticmethod
+    def _synthesis_messages(synthesis_task: MemoizedTask) -> list:
+        """Build the synthesis prompt from the agent persona, task and upstream outputs"""
+        agent = synthesis_task.agent
+        context = synthesis_task.context_text()
+        return [
+            SystemMessage(content=f"You are {agent.role}. {agent.backstory}\nYour personal goal is: {agent.goal}"),
+            HumanMessage(content=f"{synthesis_task.prompt()}\n\nThis is the context you're working with:\n{context}")
+        ]
+    
+    async def execute_analysis_batch(self, queries: List[RegulationQuery], max_concurrency: int = 10) -> List[str]:
+        """Execute the multi-agent analysis for many queries concurrently"""
+        semaphore = asyncio.Semaphore(max_concurrency)
+        
+        async def run(query: RegulationQuery, documents: str) -> str:
+            async with semaphore:
+                # Agents hold per-kickoff state (crew, executor), so every concurrent
+                # crew gets its own set sharing the same LLM and tools
+                return await self.execute_analysis_async(query, agents=self._create_agents(), documents=documents)
+        
+        logger.info("Starting batch analysis of %d queries (max %d concurrent)", len(queries), max_concurrency)
+        
+        # One embedding call and one similarity search for the whole batch
+        documents = await asyncio.to_thread(
+            self.document_tool.search_documents_batch, [query.query for query in queries]
+        )
+        
+        return list(await asyncio.gather(*(run(query, docs) for query, docs in zip(queries, documents))))
+    
+    def close(self):
+        """Close the synchronous HTTP connection pool, if the crew created it"""
+        if self._owns_http_client:
+            self._http_client.close()
+    
+    async def aclose(self):
+        """Close the HTTP connection pools the crew created"""
+        self.close()
+        if self._owns_http_async_client:
+            await self._http_async_client.aclose()
+    
+    async def __aenter__(self):
+        return self
+    
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.aclose()
 
 def main():
     """Test the multi-agent system"""
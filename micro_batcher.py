@@ -0,0 +1,143 @@
+"""
+Micro-batching of concurrent analysis requests for the multi-agent system
+"""
+
+import asyncio
+from concurrent.futures import Executor
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from crew_ai_system import StuttgartBuildingRegulationCrew, RegulationQuery
+import logging
+
+logger = logging.getLogger(__name__)
+
+# A queued request: the query, its embedding from a cache miss (if any) and the caller's future
+_Pending = Tuple[RegulationQuery, Optional[np.ndarray], asyncio.Future]
+
+class MicroBatcher:
+    """Collects analysis requests for a short window and runs them as few crews as possible.
+
+    Requests arriving within the window that share a project context
+    (project type, district, location and urgency) are answered by one merged
+    crew run with numbered sub-questions; identical questions are asked once
+    and share the answer. Requests without a partner, and groups whose merged
+    report cannot be split, run one crew per distinct question.
+
+    Merging trades isolation for throughput: questions from different callers
+    share one prompt, so one question can colour another's section. Merged
+    sections are therefore returned only to the callers of that run and never
+    stored in the response cache.
+    """
+
+    def __init__(
+        self,
+        crew_system: StuttgartBuildingRegulationCrew,
+        executor: Executor,
+        max_batch: int = 4,
+        window_ms: float = 200,
+    ):
+        self.crew_system = crew_system
+        self.executor = executor
+        self.max_batch = max_batch
+        self.window = window_ms / 1000
+        self._queue: "asyncio.Queue[_Pending]" = asyncio.Queue()
+        self._consumer: Optional[asyncio.Task] = None
+        self._dispatches: set = set()
+
+    def start(self) -> None:
+        """Start the background consumer on the running event loop"""
+        self._consumer = asyncio.create_task(self._consume())
+
+    async def stop(self) -> None:
+        """Stop the consumer and cancel anything still waiting for a batch"""
+        if self._consumer:
+            self._consumer.cancel()
+            await asyncio.gather(self._consumer, return_exceptions=True)
+        for dispatch in list(self._dispatches):
+            dispatch.cancel()
+        while not self._queue.empty():
+            _, _, future = self._queue.get_nowait()
+            future.cancel()
+
+    async def submit(self, query: RegulationQuery, query_vector: Optional[np.ndarray] = None) -> str:
+        """Queue a query and wait for its analysis.
+
+        query_vector is the embedding from a response cache miss, so a single
+        crew run neither embeds nor looks the query up again.
+        """
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((query, query_vector, future))
+        return await future
+
+    @staticmethod
+    def _group_key(query: RegulationQuery) -> tuple:
+        return (query.project_type, query.district, query.location, query.urgency)
+
+    async def _consume(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.window
+            while len(batch) < self.max_batch:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            groups: Dict[tuple, List[_Pending]] = {}
+            for query, query_vector, future in batch:
+                if not future.cancelled():
+                    groups.setdefault(self._group_key(query), []).append((query, query_vector, future))
+
+            for items in groups.values():
+                dispatch = asyncio.create_task(self._dispatch(items))
+                self._dispatches.add(dispatch)
+                dispatch.add_done_callback(self._dispatches.discard)
+
+    async def _dispatch(self, items: List[_Pending]) -> None:
+        # Identical questions are asked once and share the answer
+        distinct: Dict[str, List[_Pending]] = {}
+        for item in items:
+            distinct.setdefault(item[0].query.strip(), []).append(item)
+        groups = list(distinct.values())
+
+        loop = asyncio.get_running_loop()
+        try:
+            if len(groups) > 1:
+                logger.info("Merging %d queries into one crew run", len(groups))
+                answers = await loop.run_in_executor(
+                    self.executor, self.crew_system.execute_merged_analysis, [group[0][0] for group in groups]
+                )
+                if answers is not None:
+                    for group, answer in zip(groups, answers):
+                        self._resolve(group, answer)
+                    return
+                logger.info("Falling back to %d individual crew runs", len(groups))
+
+            await asyncio.gather(*(self._run_single(group) for group in groups))
+        except Exception as e:
+            for _, _, future in items:
+                if not future.done():
+                    future.set_exception(e)
+
+    async def _run_single(self, group: List[_Pending]) -> None:
+        query, query_vector, _ = group[0]
+        try:
+            result = await self.crew_system.execute_analysis_async(query, self.executor, query_vector=query_vector)
+        except Exception as e:
+            for _, _, future in group:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        self._resolve(group, result)
+
+    @staticmethod
+    def _resolve(group: List[_Pending], answer: str) -> None:
+        for _, _, future in group:
+            if not future.done():
+                future.set_result(answer)
@@ -7,20 +7,26 @@ from dotenv import load_dotenv
 load_dotenv()
 
 import os
-import json
+import orjson
+import gzip
+import time
+import hashlib
 import asyncio
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
+from pathlib import Path
 from typing import Optional, Dict, Any
 from contextlib import asynccontextmanager
 
-from fastapi import FastAPI, HTTPException, BackgroundTasks
+from fastapi import FastAPI, HTTPException, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import HTMLResponse, JSONResponse
-from pydantic import BaseModel
+from fastapi.responses import HTMLResponse, ORJSONResponse, StreamingResponse
+from pydantic import BaseModel, ConfigDict
 
 # Import our multi-agent system
-from crew_ai_system import StuttgartBuildingRegulationCrew, RegulationQuery
+from crew_ai_system import StuttgartBuildingRegulationCrew, RegulationQuery, create_http_client
+from micro_batcher import MicroBatcher
 
 # Existing imports
 from schemas import ChatRequest, ChatResponse
@@ -33,8 +39,60 @@ logger = logging.getLogger(__name__)
 # Global variables
 crew_system: Optional[StuttgartBuildingRegulationCrew] = None
 
+# Number of crew analyses that may run at the same time
+CREW_POOL_SIZE = int(os.getenv("CREW_POOL_SIZE", 4))
+
+# Requests arriving within BATCH_WINDOW_MS of each other are merged into one crew run
+# when they share a project context, up to BATCH_MAX requests per run
+BATCH_MAX = int(os.getenv("BATCH_MAX", 4))
+BATCH_WINDOW_MS = float(os.getenv("BATCH_WINDOW_MS", 200))
+
+# Comma-separated origins allowed to call the API from a browser
+ALLOWED_ORIGINS = [
+    origin.strip()
+    for origin in os.getenv(
+        "ALLOWED_ORIGINS",
+        "https://stuttgartregagent-production.up.railway.app,http://localhost:8000"
+    ).split(",")
+    if origin.strip()
+]
+
+# Main interface, read and gzip-compressed once at startup
+HOME_PAGE_HTML = (Path(__file__).parent / "static" / "multi_agent.html").read_bytes()
+HOME_PAGE_GZIP = gzip.compress(HOME_PAGE_HTML)
+HOME_PAGE_ETAG = f'W/"{hashlib.md5(HOME_PAGE_HTML).hexdigest()}"'
+
+# Agents of the crew, in pipeline order
+AGENTS_USED: tuple = (
+    "Document Research Specialist",
+    "Regulatory Legal Analyst",
+    "Technical Standards Expert",
+    "Compliance Strategy Advisor",
+    "Professional Synthesis Manager"
+)
+
+# /health payload of a running crew (startup requires the API key); each call only stamps the time
+_HEALTH_TEMPLATE = {
+    "status": "healthy",
+    "timestamp": None,
+    "multi_agent_ready": True,
+    "components": {
+        "crew_system": "ready",
+        "openai_api": "configured",
+        "document_database": "available"
+    },
+    "agents": AGENTS_USED
+}
+
+# /ping never changes: serialized once, and cacheable for a second by proxies and load balancers
+_PING_BYTES = orjson.dumps({"status": "ok", "service": "running"})
+_PING_RESPONSE = Response(content=_PING_BYTES, media_type="application/json", headers={"Cache-Control": "public, max-age=1"})
+
 class MultiAgentRequest(BaseModel):
     """Request model for multi-agent analysis"""
+    # Immutable and hashable; free-text fields are capped to bound the prompt size
+    model_config = ConfigDict(frozen=True, extra="ignore", str_max_length=4096, validate_assignment=False)
+    
     query: str
     project_type: str = "mixed-use"
     location: str = "Stuttgart"
@@ -44,6 +102,9 @@ class MultiAgentRequest(BaseModel):
 
 class MultiAgentResponse(BaseModel):
     """Response model for multi-agent analysis"""
+    # No str_max_length here: full reports routinely exceed 4096 characters
+    model_config = ConfigDict(frozen=True, extra="ignore", validate_assignment=False)
+    
     analysis: str
     timestamp: str
     query_details: Dict[str, Any]
@@ -56,394 +117,237 @@ async def lifespan(app: FastAPI):
     global crew_system
     
     try:
-        print("🚀 Starting Stuttgart Building Regulation Multi-Agent System...")
+        logger.info("Starting Stuttgart Building Regulation Multi-Agent System...")
         
         # Step 1: Validate environment
-        print("Step 1: Validating environment variables...")
+        logger.info("Step 1: Validating environment variables...")
         openai_api_key = os.getenv("OPENAI_API_KEY")
+        app.state.openai_configured = bool(openai_api_key)
         if not openai_api_key:
             raise ValueError("OPENAI_API_KEY environment variable is required")
-        print("✅ Environment variables validated")
+        logger.info("Environment variables validated")
         
         # Step 2: Initialize multi-agent system
-        print("Step 2: Initializing multi-agent crew...")
-        crew_system = StuttgartBuildingRegulationCrew(openai_api_key)
-        print("✅ Multi-agent crew initialized successfully")
+        logger.info("Step 2: Initializing multi-agent crew...")
+        # Connection pools owned by the app, so they live exactly as long as the worker
+        app.state.http_client = create_http_client()
+        app.state.http_async_client = create_http_client(asynchronous=True)
+        crew_system = StuttgartBuildingRegulationCrew(
+            openai_api_key,
+            http_client=app.state.http_client,
+            http_async_client=app.state.http_async_client
+        )
+        logger.info("Multi-agent crew initialized successfully")
+        
+        # Blocking crew runs go to a bounded worker pool so the event loop stays free
+        app.state.executor = ThreadPoolExecutor(max_workers=CREW_POOL_SIZE, thread_name_prefix="crew")
+        logger.info("Crew worker pool ready (%d workers)", CREW_POOL_SIZE)
         
-        print("✅ APP STARTED SUCCESSFULLY!")
-        print("=" * 60)
-        print("Available endpoints:")
-        print("- GET  /: Main interface")
-        print("- POST /chat: Single-agent chat (legacy)")
-        print("- POST /multi-agent: Multi-agent analysis (new)")
-        print("- GET  /health: System health check")
-        print("=" * 60)
+        app.state.batcher = MicroBatcher(crew_system, app.state.executor, max_batch=BATCH_MAX, window_ms=BATCH_WINDOW_MS)
+        app.state.batcher.start()
+        logger.info("Request batcher ready (up to %d queries per %.0f ms window)", BATCH_MAX, BATCH_WINDOW_MS)
+        
+        logger.info(
+            "App started successfully. Available endpoints:\n"
+            "- GET  /: Main interface\n"
+            "- POST /chat: Single-agent chat (legacy)\n"
+            "- POST /multi-agent: Multi-agent analysis (new)\n"
+            "- POST /multi-agent/stream: Multi-agent analysis as Server-Sent Events\n"
+            "- GET  /health: System health check"
+        )
         
         yield
         
     except Exception as e:
-        logger.error(f"❌ Failed to start application: {e}")
+        logger.error("Failed to start application: %s", e)
         raise
     finally:
-        print("🔄 Shutting down application...")
+        logger.info("Shutting down application...")
+        batcher = getattr(app.state, "batcher", None)
+        if batcher:
+            await batcher.stop()
+        executor = getattr(app.state, "executor", None)
+        if executor:
+            executor.shutdown(wait=False, cancel_futures=True)
+        http_client = getattr(app.state, "http_client", None)
+        if http_client:
+            http_client.close()
+        http_async_client = getattr(app.state, "http_async_client", None)
+        if http_async_client:
+            await http_async_client.aclose()
 
 # Create FastAPI app
 app = FastAPI(
     title="Stuttgart Building Regulations AI",
     description="Multi-Agent AI System for Stuttgart Building Code Analysis",
     version="2.0.0",
-    lifespan=lifespan
+    lifespan=lifespan,
+    default_response_class=ORJSONResponse
 )
 
 # Add CORS middleware
 app.add_middleware(
     CORSMiddleware,
-    allow_origins=["*"],
+    allow_origins=ALLOWED_ORIGINS,
     allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
+    allow_methods=["GET", "POST"],
+    allow_headers=["Content-Type", "Authorization"],
 )
 
 # Mount static files
 if os.path.exists("static"):
     app.mount("/static", StaticFiles(directory="static"), name="static")
 
+def _etag_matches(if_none_match: str, etag: str) -> bool:
+    """Weak If-None-Match comparison against a list of ETags or *"""
+    tags = [tag.strip() for tag in if_none_match.split(",")]
+    return "*" in tags or etag.removeprefix("W/") in (tag.removeprefix("W/") for tag in tags)
+
+def _accepts_gzip(accept_encoding: str) -> bool:
+    """Whether Accept-Encoding allows gzip, explicitly or through *, with a non-zero q"""
+    qualities = {}
+    for token in accept_encoding.split(","):
+        coding, *params = token.split(";")
+        quality = 1.0
+        for param in params:
+            name, _, value = param.partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        qualities[coding.strip().lower()] = quality
+    return qualities.get("gzip", qualities.get("*", 0.0)) > 0
+
 @app.get("/", response_class=HTMLResponse)
-async def home():
+async def home(request: Request):
     """Serve the main application interface"""
-    html_content = """
-    <!DOCTYPE html>
-    <html lang="en">
-    <head>
-        <meta charset="UTF-8">
-        <meta name="viewport" content="width=device-width, initial-scale=1.0">
-        <title>Stuttgart Building Regulations AI - Multi-Agent System</title>
-        <style>
-            * { margin: 0; padding: 0; box-sizing: border-box; }
-            body { 
-                font-family: 'Segoe UI', Tahoma, Geneva, Verdana, sans-serif; 
-                background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
-                min-height: 100vh;
-                color: #333;
-            }
-            .container { 
-                max-width: 1200px; 
-                margin: 0 auto; 
-                padding: 20px; 
-            }
-            .header {
-                text-align: center;
-                color: white;
-                margin-bottom: 30px;
-            }
-            .header h1 { 
-                font-size: 2.5rem; 
-                margin-bottom: 10px;
-                text-shadow: 2px 2px 4px rgba(0,0,0,0.3);
-            }
-            .header p { 
-                font-size: 1.2rem; 
-                opacity: 0.9; 
-            }
-            .analysis-section {
-                background: white;
-                border-radius: 15px;
-                padding: 30px;
-                margin-bottom: 20px;
-                box-shadow: 0 10px 30px rgba(0,0,0,0.2);
-            }
-            .query-form {
-                display: grid;
-                gap: 20px;
-                margin-bottom: 30px;
-            }
-            .form-group {
-                display: flex;
-                flex-direction: column;
-            }
-            .form-group label {
-                font-weight: 600;
-                margin-bottom: 5px;
-                color: #555;
-            }
-            .form-group input, .form-group select, .form-group textarea {
-                padding: 12px;
-                border: 2px solid #e1e5e9;
-                border-radius: 8px;
-                font-size: 16px;
-                transition: border-color 0.3s;
-            }
-            .form-group input:focus, .form-group select:focus, .form-group textarea:focus {
-                outline: none;
-                border-color: #667eea;
-            }
-            .form-group textarea {
-                min-height: 120px;
-                resize: vertical;
-            }
-            .analyze-btn {
-                background: linear-gradient(45deg, #667eea, #764ba2);
-                color: white;
-                border: none;
-                padding: 15px 30px;
-                border-radius: 8px;
-                font-size: 18px;
-                font-weight: 600;
-                cursor: pointer;
-                transition: transform 0.2s;
-            }
-            .analyze-btn:hover {
-                transform: translateY(-2px);
-            }
-            .analyze-btn:disabled {
-                opacity: 0.6;
-                cursor: not-allowed;
-                transform: none;
-            }
-            .results-section {
-                margin-top: 30px;
-                padding: 20px;
-                background: #f8f9fa;
-                border-radius: 10px;
-                border-left: 4px solid #667eea;
-            }
-            .results-section h3 {
-                color: #667eea;
-                margin-bottom: 15px;
-            }
-            .loading {
-                text-align: center;
-                padding: 40px;
-                color: #667eea;
-            }
-            .spinner {
-                border: 4px solid #f3f3f3;
-                border-top: 4px solid #667eea;
-                border-radius: 50%;
-                width: 40px;
-                height: 40px;
-                animation: spin 1s linear infinite;
-                margin: 0 auto 20px;
-            }
-            @keyframes spin {
-                0% { transform: rotate(0deg); }
-                100% { transform: rotate(360deg); }
-            }
-            .agent-badge {
-                display: inline-block;
-                background: #667eea;
-                color: white;
-                padding: 4px 8px;
-                border-radius: 4px;
-                font-size: 12px;
-                margin: 2px;
-            }
-        </style>
-    </head>
-    <body>
-        <div class="container">
-            <div class="header">
-                <h1>🏗️ Stuttgart Building Regulations AI</h1>
-                <p>Multi-Agent System for Professional Building Code Analysis</p>
-            </div>
-            
-            <div class="analysis-section">
-                <h2>Professional Building Regulation Analysis</h2>
-                <p style="margin-bottom: 20px; color: #666;">
-                    Our multi-agent AI system provides comprehensive analysis using specialized agents for 
-                    document research, legal interpretation, technical standards, and compliance strategy.
-                </p>
-                
-                <form class="query-form" id="analysisForm">
-                    <div class="form-group">
-                        <label for="query">Your Building Regulation Question</label>
-                        <textarea 
-                            id="query" 
-                            name="query" 
-                            placeholder="e.g., What are the complete requirements for building a mixed-use development with residential and commercial space in Stuttgart?"
-                            required
-                        ></textarea>
-                    </div>
-                    
-                    <div style="display: grid; grid-template-columns: 1fr 1fr; gap: 20px;">
-                        <div class="form-group">
-                            <label for="project_type">Project Type</label>
-                            <select id="project_type" name="project_type">
-                                <option value="mixed-use">Mixed-Use Development</option>
-                                <option value="residential">Residential Building</option>
-                                <option value="commercial">Commercial Building</option>
-                                <option value="industrial">Industrial Building</option>
-                                <option value="office">Office Building</option>
-                                <option value="renovation">Renovation Project</option>
-                            </select>
-                        </div>
-                        
-                        <div class="form-group">
-                            <label for="district">Stuttgart District</label>
-                            <select id="district" name="district">
-                                <option value="general">General Stuttgart</option>
-                                <option value="Zuffenhausen">Zuffenhausen</option>
-                                <option value="Stuttgart-Mitte">Stuttgart-Mitte</option>
-                                <option value="Stuttgart-West">Stuttgart-West</option>
-                                <option value="Stuttgart-Ost">Stuttgart-Ost</option>
-                                <option value="Stuttgart-Nord">Stuttgart-Nord</option>
-                                <option value="Stuttgart-Süd">Stuttgart-Süd</option>
-                            </select>
-                        </div>
-                    </div>
-                    
-                    <button type="submit" class="analyze-btn" id="analyzeBtn">
-                        🤖 Start Multi-Agent Analysis
-                    </button>
-                </form>
-                
-                <div id="results" class="results-section" style="display: none;">
-                    <h3>Analysis Results</h3>
-                    <div id="resultsContent"></div>
-                </div>
-            </div>
-        </div>
+    if _etag_matches(request.headers.get("if-none-match", ""), HOME_PAGE_ETAG):
+        return Response(status_code=304, headers={"ETag": HOME_PAGE_ETAG})
+    
+    headers = {"ETag": HOME_PAGE_ETAG, "Cache-Control": "no-cache", "Vary": "Accept-Encoding"}
+    if _accepts_gzip(request.headers.get("accept-encoding", "")):
+        headers["Content-Encoding"] = "gzip"
+        return Response(content=HOME_PAGE_GZIP, media_type="text/html", headers=headers)
+    return Response(content=HOME_PAGE_HTML, media_type="text/html", headers=headers)
 
-        <script>
-            document.getElementById('analysisForm').addEventListener('submit', async function(e) {
-                e.preventDefault();
-                
-                const form = e.target;
-                const formData = new FormData(form);
-                const analyzeBtn = document.getElementById('analyzeBtn');
-                const results = document.getElementById('results');
-                const resultsContent = document.getElementById('resultsContent');
-                
-                // Disable button and show loading
-                analyzeBtn.disabled = true;
-                analyzeBtn.innerHTML = '🔄 Analyzing...';
-                results.style.display = 'block';
-                resultsContent.innerHTML = `
-                    <div class="loading">
-                        <div class="spinner"></div>
-                        <p>Multi-agent analysis in progress...</p>
-                        <p><small>This may take 1-2 minutes as our agents collaborate</small></p>
-                    </div>
-                `;
-                
-                try {
-                    const response = await fetch('/multi-agent', {
-                        method: 'POST',
-                        headers: {
-                            'Content-Type': 'application/json',
-                        },
-                        body: JSON.stringify({
-                            query: formData.get('query'),
-                            project_type: formData.get('project_type'),
-                            district: formData.get('district'),
-                            location: 'Stuttgart',
-                            urgency: 'normal',
-                            use_multi_agent: true
-                        })
-                    });
-                    
-                    if (!response.ok) {
-                        throw new Error(`HTTP error! status: ${response.status}`);
-                    }
-                    
-                    const data = await response.json();
-                    
-                    resultsContent.innerHTML = `
-                        <div style="white-space: pre-wrap; line-height: 1.6;">${data.analysis}</div>
-                        <hr style="margin: 20px 0;">
-                        <p><strong>Analysis completed at:</strong> ${data.timestamp}</p>
-                        ${data.processing_time ? `<p><strong>Processing time:</strong> ${data.processing_time.toFixed(2)} seconds</p>` : ''}
-                    `;
-                    
-                } catch (error) {
-                    console.error('Error:', error);
-                    resultsContent.innerHTML = `
-                        <div style="color: #dc3545;">
-                            <h4>Error occurred during analysis</h4>
-                            <p>${error.message}</p>
-                            <p>Please try again or contact support if the issue persists.</p>
-                        </div>
-                    `;
-                } finally {
-                    // Re-enable button
-                    analyzeBtn.disabled = false;
-                    analyzeBtn.innerHTML = '🤖 Start Multi-Agent Analysis';
-                }
-            });
-        </script>
-    </body>
-    </html>
+async def _run_analysis(
+    query: str,
+    project_type: str = "mixed-use",
+    location: str = "Stuttgart",
+    district: str = "general",
+    urgency: str = "normal"
+) -> Dict[str, Any]:
+    """Run (or serve from cache) a multi-agent analysis; shared by /multi-agent and /chat.
+    
+    Returns the MultiAgentResponse payload as a plain dict, serialized once by the caller.
     """
-    return html_content
-
-@app.post("/multi-agent", response_model=MultiAgentResponse)
-async def multi_agent_analysis(request: MultiAgentRequest, background_tasks: BackgroundTasks):
-    """Execute multi-agent analysis"""
     if not crew_system:
         raise HTTPException(status_code=503, detail="Multi-agent system not initialized")
     
     try:
-        start_time = datetime.now()
+        start = time.perf_counter()
         
         # Create regulation query
-        query = RegulationQuery(
-            query=request.query,
-            project_type=request.project_type,
-            location=request.location,
-            district=request.district,
-            urgency=request.urgency
+        regulation_query = RegulationQuery(
+            query=query,
+            project_type=project_type,
+            location=location,
+            district=district,
+            urgency=urgency
         )
         
-        # Execute multi-agent analysis
-        logger.info(f"Starting multi-agent analysis for: {request.query}")
-        crew_result = crew_system.execute_analysis(query)
-        analysis_result = str(crew_result)  # Convert CrewOutput to string
+        # Semantically equivalent questions are answered from the cache (a few ms);
+        # the lookup runs on the default executor so it never queues behind crew runs
+        cached_result, query_vector = await asyncio.to_thread(crew_system.cached_analysis, regulation_query)
         
-        end_time = datetime.now()
-        processing_time = (end_time - start_time).total_seconds()
+        if cached_result is not None:
+            logger.info("Serving cached multi-agent analysis for: %s", query)
+            analysis_result = cached_result
+        else:
+            # Execute multi-agent analysis
+            logger.info("Starting multi-agent analysis for: %s", query)
+            # Concurrent questions about the same project share one crew run
+            analysis_result = await app.state.batcher.submit(regulation_query, query_vector)
+        
+        processing_time = time.perf_counter() - start
         
-        return MultiAgentResponse(
-            analysis=analysis_result,
-            timestamp=end_time.isoformat(),
-            query_details={
-                "query": request.query,
-                "project_type": request.project_type,
-                "location": request.location,
-                "district": request.district,
-                "urgency": request.urgency
+        return {
+            "analysis": analysis_result,
+            "timestamp": datetime.now().isoformat(),
+            "query_details": {
+                "query": query,
+                "project_type": project_type,
+                "location": location,
+                "district": district,
+                "urgency": urgency,
+                "cache_hit": cached_result is not None
             },
-            processing_time=processing_time,
-            agents_used=[
-                "Document Research Specialist",
-                "Regulatory Legal Analyst", 
-                "Technical Standards Expert",
-                "Compliance Strategy Advisor",
-                "Professional Synthesis Manager"
-            ]
-        )
+            "processing_time": processing_time,
+            "agents_used": AGENTS_USED
+        }
         
     except Exception as e:
-        logger.error(f"Multi-agent analysis error: {e}")
+        logger.error("Multi-agent analysis error: %s", e)
         raise HTTPException(status_code=500, detail=f"Analysis failed: {str(e)}")
 
+# MultiAgentResponse only documents the payload; it is not re-validated on the way out
+@app.post("/multi-agent", responses={200: {"model": MultiAgentResponse}})
+async def multi_agent_analysis(request: MultiAgentRequest):
+    """Execute multi-agent analysis"""
+    return ORJSONResponse(content=await _run_analysis(
+        request.query,
+        project_type=request.project_type,
+        location=request.location,
+        district=request.district,
+        urgency=request.urgency
+    ))
+
+@app.post("/multi-agent/stream")
+async def multi_agent_stream(request: MultiAgentRequest):
+    """Stream the multi-agent analysis as Server-Sent Events"""
+    if not crew_system:
+        raise HTTPException(status_code=503, detail="Multi-agent system not initialized")
+    
+    query = RegulationQuery(
+        query=request.query,
+        project_type=request.project_type,
+        location=request.location,
+        district=request.district,
+        urgency=request.urgency
+    )
+    
+    async def events():
+        # Runs on the event loop; the crew work itself goes to the bounded crew pool
+        start = time.perf_counter()
+        try:
+            async for agent, delta in crew_system.stream_analysis(query, app.state.executor):
+                yield f"event: agent\ndata: {orjson.dumps({'agent': agent, 'delta': delta}).decode()}\n\n"
+        except Exception as e:
+            logger.error("Streaming multi-agent analysis error: %s", e)
+            yield f"event: error\ndata: {orjson.dumps({'detail': f'Analysis failed: {str(e)}'}).decode()}\n\n"
+            return
+        
+        done = {"timestamp": datetime.now().isoformat(), "processing_time": time.perf_counter() - start}
+        yield f"event: done\ndata: {orjson.dumps(done).decode()}\n\n"
+    
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 @app.post("/chat", response_model=ChatResponse)
 async def legacy_chat_endpoint(request: ChatRequest):
     """Legacy single-agent endpoint for backward compatibility"""
     try:
         # For backward compatibility, redirect to multi-agent if available
         if crew_system:
-            multi_agent_request = MultiAgentRequest(
-                query=request.message,
-                project_type="mixed-use",
-                location="Stuttgart",
-                district="general"
-            )
-            
-            result = await multi_agent_analysis(multi_agent_request, BackgroundTasks())
+            result = await _run_analysis(request.message)
             
             return ChatResponse(
-                message=result.analysis,
-                timestamp=result.timestamp,
+                message=result["analysis"],
+                timestamp=result["timestamp"],
                 context_used=5,  # Placeholder
                 conversation_id=getattr(request, 'conversation_id', None)
             )
@@ -451,41 +355,39 @@ async def legacy_chat_endpoint(request: ChatRequest):
             raise HTTPException(status_code=503, detail="AI system not available")
             
     except Exception as e:
-        logger.error(f"Legacy chat error: {e}")
+        logger.error("Legacy chat error: %s", e)
         raise HTTPException(status_code=500, detail=f"Chat failed: {str(e)}")
 
 # Add this as a backup simple health check
 @app.get("/ping")
 async def ping():
     """Simple ping endpoint for basic health checking"""
-    return {"status": "ok", "service": "running"}
+    return _PING_RESPONSE
 
 # Keep your detailed health check as well
 @app.get("/health")
-async def health_check():
+async def health_check(response: Response):
     """Detailed system health check"""
+    response.headers["Cache-Control"] = "public, max-age=1"
     try:
+        if crew_system:
+            return {**_HEALTH_TEMPLATE, "timestamp": datetime.now().isoformat()}
+        
         status = {
             "status": "healthy",
             "timestamp": datetime.now().isoformat(),
-            "multi_agent_ready": crew_system is not None,
+            "multi_agent_ready": False,
             "components": {
-                "crew_system": "ready" if crew_system else "not_initialized",
-                "openai_api": "configured" if os.getenv("OPENAI_API_KEY") else "missing",
+                "crew_system": "not_initialized",
+                "openai_api": "configured" if getattr(app.state, "openai_configured", False) else "missing",
                 "document_database": "available"
             },
-            "agents": [
-                "Document Research Specialist",
-                "Regulatory Legal Analyst", 
-                "Technical Standards Expert",
-                "Compliance Strategy Advisor",
-                "Professional Synthesis Manager"
-            ] if crew_system else []
+            "agents": []
         }
         return status
         
     except Exception as e:
-        return JSONResponse(
+        return ORJSONResponse(
             status_code=500,
             content={
                 "status": "unhealthy", 
@@ -497,4 +399,14 @@ async def health_check():
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=int(os.getenv("PORT", 8000)))
\ No newline at end of file
+    # Each worker process runs its own lifespan, and with it its own crew; the caches
+    # under CACHE_DIR are shared through their SQLite files. "auto" picks uvloop and
+    # httptools where they are installed and falls back to asyncio and h11 elsewhere
+    uvicorn.run(
+        "multi_agent_app:app",
+        host="0.0.0.0",
+        port=int(os.getenv("PORT", 8000)),
+        workers=int(os.getenv("WEB_CONCURRENCY", os.cpu_count() or 2)),
+        loop="auto",
+        http="auto"
+    )
\ No newline at end of file
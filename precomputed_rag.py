@@ -122,7 +122,8 @@ class EnhancedPrecomputedRAGSystem:
             # Load embeddings
             embeddings_path = self.embeddings_dir / "embeddings.npy"
             if embeddings_path.exists():
-                self.embeddings = np.load(embeddings_path)
+                # Memory-map so multiple worker processes share the page cache instead of copying
+                self.embeddings = np.load(embeddings_path, mmap_mode='r')
                 logger.info(f"Loaded embeddings with shape: {self.embeddings.shape}")
             else:
                 logger.warning("embeddings.npy not found")
@@ -150,6 +151,7 @@ class EnhancedPrecomputedRAGSystem:
         try:
             # Get query embedding
             query_embedding = self.model.encode([query])
+            document_type_lower = filter_document_type.lower() if filter_document_type else None
             
             if self.embeddings.shape[0] > 0:
                 # Calculate similarities
@@ -170,9 +172,9 @@ class EnhancedPrecomputedRAGSystem:
                             if filter_district not in mentioned_districts:
                                 continue
                         
-                        if filter_document_type:
+                        if document_type_lower:
                             doc_type = doc.get("metadata", {}).get("document_type", "")
-                            if filter_document_type.lower() not in doc_type.lower():
+                            if document_type_lower not in doc_type.lower():
                                 continue
                         
                         score = float(similarities[idx])
@@ -205,6 +207,49 @@ class EnhancedPrecomputedRAGSystem:
                 metadata={"type": "search_error", "error": str(e)}
             )]
 
+    def search_batch(self, queries: List[str], top_k: int = 5) -> List[List[BuildingResult]]:
+        """Search many queries with one embedding call and one similarity matrix product"""
+        if not queries:
+            return []
+        
+        if not self.is_ready or len(self.documents) == 0 or self.embeddings.shape[0] == 0:
+            return [self.search(query, top_k=top_k) for query in queries]
+        
+        try:
+            query_embeddings = self.model.encode(queries)
+            similarities = np.dot(query_embeddings, self.embeddings.T)
+            
+            # Top k per row without sorting the full similarity matrix
+            k = min(top_k, similarities.shape[1])
+            top_indices = np.argpartition(-similarities, k - 1, axis=1)[:, :k]
+            
+            batch_results = []
+            for row, indices in enumerate(top_indices):
+                ranked = indices[np.argsort(-similarities[row, indices])]
+                results = []
+                for idx in ranked:
+                    if idx < len(self.documents):
+                        doc = self.documents[idx]
+                        results.append(BuildingResult(
+                            content=doc.get('content', ''),
+                            score=float(similarities[row, idx]),
+                            metadata=doc.get('metadata', {}),
+                            source=doc.get('source', 'Unknown'),
+                            citation=doc.get('citation', ''),
+                            document_id=doc.get('document_id', '')
+                        ))
+                batch_results.append(results)
+            
+            return batch_results
+            
+        except Exception as e:
+            logger.error(f"Error during enhanced batch search: {str(e)}")
+            return [[BuildingResult(
+                content="Technical error occurred during document search. Please try again.",
+                score=0.0,
+                metadata={"type": "search_error", "error": str(e)}
+            )] for _ in queries]
+
     def get_context_for_query(self, query: str, max_tokens: int = 2000, include_citations: bool = True) -> str:
         """Get enhanced context with detailed citations"""
         results = self.search(query, top_k=4)
@@ -251,10 +296,11 @@ class EnhancedPrecomputedRAGSystem:
     def get_forms_for_process(self, process_type: str) -> List[Dict]:
         """Get relevant forms for a specific building process"""
         forms = []
+        process_type_lower = process_type.lower()
         for doc in self.documents:
             metadata = doc.get("metadata", {})
             form_numbers = metadata.get("form_numbers", [])
-            if form_numbers and process_type.lower() in doc.get("content", "").lower():
+            if form_numbers and process_type_lower in doc.get("content", "").lower():
                 forms.append({
                     "form_numbers": form_numbers,
                     "document_name": metadata.get("document_name", ""),
@@ -27,7 +27,7 @@ class BuildingSearchResponse(BaseModel):
 
 class ChatRequest(BaseModel):
     """Request model for chat endpoint"""
-    message: str = Field(..., description="User message")
+    message: str = Field(..., max_length=4096, description="User message")
     conversation_id: Optional[str] = Field(default=None, description="Optional conversation ID")
 
 class ChatResponse(BaseModel):
@@ -63,4 +63,45 @@ class DocumentUploadResponse(BaseModel):
     document_id: str = Field(..., description="Uploaded document ID")
     filename: str = Field(..., description="Document filename")
     status: str = Field(..., description="Upload status")
-    timestamp: str = Field(..., description="Upload timestamp")
\ No newline at end of file
+    timestamp: str = Field(..., description="Upload timestamp")
+
+# Structured intermediate outputs exchanged between the multi-agent crew's tasks
+class RegulationCitation(BaseModel):
+    """A single cited regulation"""
+    document: str = Field(..., description="Document name")
+    level: str = Field(..., description="Regulatory level (federal/state/local)")
+    reference: str = Field(default="", description="Section, paragraph or legal reference number")
+    page: str = Field(default="", description="Page number")
+    excerpt: str = Field(..., description="Short relevant excerpt")
+
+class DocResearchResult(BaseModel):
+    """Output of the document research task"""
+    regulations: List[RegulationCitation] = Field(..., description="Relevant regulations with citations")
+    summary: str = Field(..., description="Brief summary of the research findings")
+
+class HierarchyAnalysis(BaseModel):
+    """Output of the legal hierarchy task"""
+    applicable_levels: List[str] = Field(..., description="Regulatory levels that apply")
+    precedence: List[str] = Field(..., description="Precedence rules, highest priority first")
+    conflicts: List[str] = Field(default_factory=list, description="Conflicts between regulatory levels and their resolution")
+    district_provisions: List[str] = Field(default_factory=list, description="Special provisions for the district")
+    summary: str = Field(..., description="Brief summary of the hierarchy analysis")
+
+class TechnicalRequirement(BaseModel):
+    """A single technical requirement"""
+    standard: str = Field(..., description="Standard or regulation (e.g. DIN 18040)")
+    requirement: str = Field(..., description="What the standard requires")
+    compliance_criteria: str = Field(..., description="How compliance is demonstrated")
+
+class TechnicalReqs(BaseModel):
+    """Output of the technical analysis task"""
+    requirements: List[TechnicalRequirement] = Field(..., description="Technical requirements")
+    summary: str = Field(..., description="Brief summary of the technical analysis")
+
+class ComplianceStrategy(BaseModel):
+    """Output of the compliance strategy task"""
+    cost_impact_percent: float = Field(..., description="Estimated additional cost in percent")
+    timeline_weeks: int = Field(..., description="Estimated additional timeline in weeks")
+    risks: List[str] = Field(default_factory=list, description="Non-compliance risks and mitigations")
+    alternatives: List[str] = Field(default_factory=list, description="Alternative compliance methods")
+    recommendations: List[str] = Field(..., description="Strategic recommendations")
@@ -0,0 +1,373 @@
+"""
+Semantic response cache for the Stuttgart Building Regulations multi-agent system
+"""
+
+import hashlib
+import sqlite3
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+import logging
+
+logger = logging.getLogger(__name__)
+
+class SemanticCache:
+    """Embedding nearest-neighbour cache with TTL, LRU eviction and disk persistence.
+
+    Entries are partitioned by scope (e.g. project type and district) so that a
+    paraphrased question is only answered from a report produced for the same
+    project context. Vectors are L2-normalized, so an inner product search over
+    a scope is a cosine similarity search. Entries are persisted as SQLite rows,
+    so a store or eviction writes only the rows it touches.
+
+    Several processes (e.g. uvicorn workers) may share one cache directory: every
+    lookup first picks up the rows other processes stored since the last one.
+    LRU eviction is per process, so an entry another process evicted is still
+    served here until it expires or is evicted here as well.
+    """
+
+    def __init__(
+        self,
+        embed_fn: Callable[[List[str]], np.ndarray],
+        cache_dir: Path,
+        threshold: float = 0.85,
+        ttl_seconds: float = 24 * 60 * 60,
+        max_entries: int = 1000,
+    ):
+        self.embed_fn = embed_fn
+        self.cache_dir = Path(cache_dir)
+        self.threshold = threshold
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+
+        # entry_id -> {"scope", "response", "created_at"}, kept in LRU order
+        self._entries: "OrderedDict[str, Dict]" = OrderedDict()
+        # scope -> (entry ids, normalized vectors, creation times), the flat inner-product index
+        self._scopes: Dict[str, tuple] = {}
+        # Newest created_at read from disk, where the next refresh resumes
+        self._synced_at = 0.0
+        self._lock = threading.Lock()
+
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(str(self._db_path), check_same_thread=False)
+        with self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS entries ("
+                "id TEXT PRIMARY KEY, scope TEXT NOT NULL, response TEXT NOT NULL, "
+                "created_at REAL NOT NULL, vector BLOB NOT NULL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS entries_created_at ON entries (created_at)")
+
+        self._load()
+
+    @property
+    def _db_path(self) -> Path:
+        return self.cache_dir / "entries.sqlite3"
+
+    def embed(self, text: str) -> np.ndarray:
+        """Embed a single text into an L2-normalized float32 vector"""
+        vector = np.asarray(self.embed_fn([text]), dtype=np.float32).reshape(-1)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm > 0 else vector
+
+    def lookup(self, text: str, scope: str, vector: Optional[np.ndarray] = None) -> Optional[str]:
+        """Return the cached response closest to text within scope, if similar enough"""
+        if vector is None:
+            vector = self.embed(text)
+
+        with self._lock:
+            self._refresh()
+            ids, _, created = self._scopes.get(scope, ([], None, None))
+            if not ids:
+                return None
+
+            # Drop expired entries first, so a live runner-up can still match
+            expired = time.time() - created > self.ttl_seconds
+            if expired.any():
+                self._forget([ids[i] for i in np.flatnonzero(expired)])
+                ids, _, _ = self._scopes.get(scope, ([], None, None))
+                if not ids:
+                    return None
+            _, vectors, _ = self._scopes[scope]
+
+            similarities = vectors @ vector
+            best = int(np.argmax(similarities))
+            if similarities[best] < self.threshold:
+                return None
+
+            entry_id = ids[best]
+            self._entries.move_to_end(entry_id)
+            logger.info("Semantic cache hit (similarity %.3f) in scope %s", similarities[best], scope)
+            return self._entries[entry_id]["response"]
+
+    def store(self, text: str, scope: str, response: str, vector: Optional[np.ndarray] = None) -> None:
+        """Add a response to the cache, evicting the least recently used entries over the cap"""
+        if vector is None:
+            vector = self.embed(text)
+        vector = np.asarray(vector, dtype=np.float32).reshape(-1)
+
+        with self._lock:
+            entry_id = uuid.uuid4().hex
+            created_at = time.time()
+            self._entries[entry_id] = {
+                "scope": scope,
+                "response": response,
+                "created_at": created_at,
+            }
+            self._add_vector(entry_id, scope, vector, created_at)
+
+            evicted = []
+            while len(self._entries) > self.max_entries:
+                oldest_id = next(iter(self._entries))
+                self._remove(oldest_id)
+                evicted.append(oldest_id)
+
+            try:
+                with self._conn:
+                    self._conn.execute(
+                        "INSERT OR REPLACE INTO entries (id, scope, response, created_at, vector) VALUES (?, ?, ?, ?, ?)",
+                        (entry_id, scope, response, created_at, vector.tobytes()),
+                    )
+                    self._delete_rows(evicted)
+            except sqlite3.Error as e:
+                logger.warning("Failed to persist semantic cache entry: %s", e)
+
+    def close(self) -> None:
+        self._conn.close()
+
+    def _add_vector(self, entry_id: str, scope: str, vector: np.ndarray, created_at: float) -> None:
+        ids, vectors, created = self._scopes.get(scope, ([], None, None))
+        row = vector.reshape(1, -1).astype(np.float32)
+        vectors = row if vectors is None else np.vstack([vectors, row])
+        created = np.array([created_at]) if created is None else np.append(created, created_at)
+        self._scopes[scope] = (ids + [entry_id], vectors, created)
+
+    def _refresh(self) -> None:
+        """Index live rows stored by other processes since the last read.
+
+        Re-reads a one second overlap, so rows another process stamped just
+        before committing are not skipped; rows already indexed are ignored.
+        """
+        try:
+            since = max(self._synced_at - 1.0, time.time() - self.ttl_seconds)
+            rows = self._conn.execute(
+                "SELECT id, scope, response, created_at, vector FROM entries WHERE created_at > ? ORDER BY created_at",
+                (since,),
+            ).fetchall()
+        except sqlite3.Error as e:
+            logger.warning("Failed to refresh semantic cache: %s", e)
+            return
+
+        for entry_id, scope, response, created_at, blob in rows:
+            self._synced_at = max(self._synced_at, created_at)
+            if entry_id not in self._entries:
+                self._entries[entry_id] = {"scope": scope, "response": response, "created_at": created_at}
+                self._add_vector(entry_id, scope, np.frombuffer(blob, dtype=np.float32), created_at)
+
+        if len(self._entries) > self.max_entries:
+            self._forget(list(self._entries)[:len(self._entries) - self.max_entries])
+
+    def _remove(self, entry_id: str) -> None:
+        """Drop an entry from the in-memory index"""
+        entry = self._entries.pop(entry_id)
+        ids, vectors, created = self._scopes[entry["scope"]]
+        position = ids.index(entry_id)
+        remaining_ids = ids[:position] + ids[position + 1:]
+        if remaining_ids:
+            self._scopes[entry["scope"]] = (
+                remaining_ids,
+                np.delete(vectors, position, axis=0),
+                np.delete(created, position),
+            )
+        else:
+            del self._scopes[entry["scope"]]
+
+    def _forget(self, entry_ids: List[str]) -> None:
+        """Drop entries from memory and from disk"""
+        for entry_id in entry_ids:
+            self._remove(entry_id)
+        try:
+            with self._conn:
+                self._delete_rows(entry_ids)
+        except sqlite3.Error as e:
+            logger.warning("Failed to delete semantic cache entries: %s", e)
+
+    def _delete_rows(self, entry_ids: List[str]) -> None:
+        if entry_ids:
+            self._conn.executemany("DELETE FROM entries WHERE id = ?", [(entry_id,) for entry_id in entry_ids])
+
+    def _load(self) -> None:
+        """Load persisted entries, dropping anything past its TTL"""
+        try:
+            cutoff = time.time() - self.ttl_seconds
+            with self._conn:
+                self._conn.execute("DELETE FROM entries WHERE created_at < ?", (cutoff,))
+            rows = self._conn.execute(
+                "SELECT id, scope, response, created_at, vector FROM entries ORDER BY created_at"
+            ).fetchall()
+
+            grouped: Dict[str, tuple] = {}
+            for entry_id, scope, response, created_at, blob in rows:
+                self._synced_at = max(self._synced_at, created_at)
+                self._entries[entry_id] = {"scope": scope, "response": response, "created_at": created_at}
+                ids, vectors, created = grouped.setdefault(scope, ([], [], []))
+                ids.append(entry_id)
+                vectors.append(np.frombuffer(blob, dtype=np.float32))
+                created.append(created_at)
+            self._scopes = {
+                scope: (ids, np.stack(vectors), np.array(created))
+                for scope, (ids, vectors, created) in grouped.items()
+            }
+
+            if len(self._entries) > self.max_entries:
+                self._forget(list(self._entries)[:len(self._entries) - self.max_entries])
+
+            logger.info("Loaded %d semantic cache entries from %s", len(self._entries), self.cache_dir)
+        except Exception as e:
+            logger.warning("Failed to load semantic cache: %s", e)
+            self._entries.clear()
+            self._scopes.clear()
+
+class ExactMatchStore:
+    """SQLite-backed key/value store with optional per-entry expiry and a row cap.
+
+    Expired rows are purged when the store opens and every purge_interval
+    writes; past max_entries the oldest rows are dropped at the same points.
+    """
+
+    def __init__(self, db_path: Path, max_entries: int = 10000, purge_interval: int = 100):
+        self.db_path = Path(db_path)
+        self.max_entries = max_entries
+        self.purge_interval = purge_interval
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._writes = 0
+        self._conn = sqlite3.connect(str(self.db_path), check_same_thread=False)
+        with self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL)"
+            )
+        with self._lock:
+            self._purge()
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, expires_at FROM cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            value, expires_at = row
+            if expires_at is not None and expires_at < time.time():
+                with self._conn:
+                    self._conn.execute("DELETE FROM cache WHERE key = ?", (key,))
+                return None
+            return value
+
+    def set(self, key: str, value: str, expire: Optional[float] = None) -> None:
+        expires_at = time.time() + expire if expire is not None else None
+        with self._lock:
+            with self._conn:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO cache (key, value, expires_at) VALUES (?, ?, ?)",
+                    (key, value, expires_at),
+                )
+            self._writes += 1
+            if self._writes % self.purge_interval == 0:
+                self._purge()
+
+    def close(self) -> None:
+        self._conn.close()
+
+    def _purge(self) -> None:
+        """Delete expired rows, then the oldest rows over the cap (REPLACE re-inserts, so rowid order is write order)"""
+        try:
+            with self._conn:
+                self._conn.execute("DELETE FROM cache WHERE expires_at < ?", (time.time(),))
+                count = self._conn.execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+                if count > self.max_entries:
+                    self._conn.execute(
+                        "DELETE FROM cache WHERE rowid IN (SELECT rowid FROM cache ORDER BY rowid LIMIT ?)",
+                        (count - self.max_entries,),
+                    )
+        except sqlite3.Error as e:
+            logger.warning("Failed to purge %s: %s", self.db_path, e)
+
+class TaskCache:
+    """Per-task output memoization for crew tasks.
+
+    Looks up an exact hash of the rendered task first, then falls back to a
+    semantic match of the query that produced it. Semantic matches are scoped
+    to the agent role, the caller's scope (project context, pre-retrieved
+    documents, expected output) and the exact upstream context, so only the
+    wording of the question may differ.
+    """
+
+    def __init__(
+        self,
+        embed_fn: Callable[[List[str]], np.ndarray],
+        cache_dir: Path,
+        threshold: float = 0.92,
+        ttl_seconds: float = 24 * 60 * 60,
+        max_entries: int = 5000,
+    ):
+        self.ttl_seconds = ttl_seconds
+        self.exact = ExactMatchStore(Path(cache_dir) / "task_outputs.sqlite3", max_entries=max_entries)
+        self.semantic = SemanticCache(
+            embed_fn=embed_fn,
+            cache_dir=Path(cache_dir) / "semantic",
+            threshold=threshold,
+            ttl_seconds=ttl_seconds,
+            max_entries=max_entries,
+        )
+
+    @staticmethod
+    def _digest(text: str) -> str:
+        return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+    def _keys(self, role: str, prompt: str, context: str, scope: str) -> tuple:
+        exact_key = self._digest(f"{role}|{prompt}|{context}")
+        semantic_scope = f"{role}|{self._digest(f'{scope}|{context}')[:16]}"
+        return exact_key, semantic_scope
+
+    def lookup(
+        self,
+        role: str,
+        prompt: str,
+        context: Optional[str] = None,
+        query_text: str = "",
+        scope: str = "",
+        query_vector: Optional[np.ndarray] = None,
+    ) -> Optional[str]:
+        """Return a previous output for this task rendering, or for a paraphrase of its query.
+
+        query_vector, if given, is the embedding of query_text and saves embedding it again.
+        """
+        exact_key, semantic_scope = self._keys(role, prompt, context or "", scope)
+        cached = self.exact.get(exact_key)
+        if cached is not None:
+            logger.info("Task cache exact hit for %s", role)
+            return cached
+        if not query_text:
+            return None
+        return self.semantic.lookup(query_text, semantic_scope, vector=query_vector)
+
+    def store(
+        self,
+        role: str,
+        prompt: str,
+        context: Optional[str],
+        output: str,
+        query_text: str = "",
+        scope: str = "",
+        query_vector: Optional[np.ndarray] = None,
+    ) -> None:
+        exact_key, semantic_scope = self._keys(role, prompt, context or "", scope)
+        self.exact.set(exact_key, output, expire=self.ttl_seconds)
+        if query_text:
+            self.semantic.store(query_text, semantic_scope, output, vector=query_vector)